@@ -15,15 +15,13 @@
 # limitations under the License.
 
 import argparse
+import copy
 import importlib
 import logging
 import os
 import subprocess
 import sys
-from pathlib import Path
-
-import psutil
-import torch
+from functools import lru_cache
 
 from accelerate.commands.config import default_config_file, load_config_from_file
 from accelerate.commands.config.config_args import SageMakerConfig
@@ -44,7 +42,6 @@ from accelerate.utils import (
     is_npu_available,
     is_rich_available,
     is_sagemaker_available,
-    is_torch_version,
     is_torch_xla_available,
     is_xpu_available,
     patch_environment,
@@ -58,7 +55,10 @@ from accelerate.utils import (
 from accelerate.utils.constants import DEEPSPEED_MULTINODE_LAUNCHERS, TORCH_DYNAMO_MODES
 
 
-if is_rich_available():
+# Checked once so the exception handlers below agree with whether `get_console` was imported
+_rich_available = is_rich_available()
+
+if _rich_available:
     from rich import get_console
     from rich.logging import RichHandler
 
@@ -78,7 +78,27 @@ options_to_group = {
     "fp8_backend": "FP8 Arguments",
 }
 
+# The `accelerate launch` flag enabled by each `distributed_type` of a config file
+distributed_type_to_flag = {
+    DistributedType.DEEPSPEED: "use_deepspeed",
+    DistributedType.MULTI_GPU: "multi_gpu",
+    DistributedType.MULTI_NPU: "multi_gpu",
+    DistributedType.MULTI_MLU: "multi_gpu",
+    DistributedType.MULTI_MUSA: "multi_gpu",
+    DistributedType.MULTI_XPU: "multi_gpu",
+    DistributedType.XLA: "tpu",
+    DistributedType.FSDP: "use_fsdp",
+    DistributedType.MEGATRON_LM: "use_megatron_lm",
+}
+
+# Config fields that `_validate_launch_command` resolves on its own instead of copying them over to the args
+separately_handled_config_fields = frozenset({"compute_environment", "mixed_precision", "distributed_type"})
 
+# The docker related arguments of `torch_xla.distributed.xla_dist`, which the TPU pod launcher doesn't support
+xla_dist_docker_flags = ("docker_container", "docker_image", "docker_run_flag")
+
+
+@lru_cache(maxsize=256)
 def clean_option(option):
     "Finds all cases of - after the first two characters and changes them to _"
     if "fp8_backend" in option:
@@ -103,29 +123,28 @@ class CustomHelpFormatter(argparse.HelpFormatter):
             "positional arguments",
             "optional arguments",
         ]
-
-    def add_argument(self, action: argparse.Action):
+        # The command line doesn't change while formatting, so only parse it once instead of once per argument
         if "accelerate" in sys.argv[0] and "launch" in sys.argv[1:]:
             args = sys.argv[2:]
         else:
             args = sys.argv[1:]
-
+        self.args = None
         if len(args) > 1:
-            args = list(map(clean_option, args))
-            used_platforms = [arg for arg in args if arg in options_to_group.keys()]
-            used_titles = [options_to_group[o] for o in used_platforms]
-            if action.container.title not in self.titles + used_titles:
+            self.args = set(map(clean_option, args))
+            used_titles = [options_to_group[arg] for arg in self.args if arg in options_to_group]
+            self.visible_titles = set(self.titles + used_titles)
+
+    def add_argument(self, action: argparse.Action):
+        args = self.args
+        if args is not None:
+            title = action.container.title
+            if title not in self.visible_titles:
                 action.help = argparse.SUPPRESS
-            elif action.container.title == "Hardware Selection Arguments":
-                if set(action.option_strings).isdisjoint(set(args)):
+            elif title in ("Hardware Selection Arguments", "Training Paradigm Arguments"):
+                if args.isdisjoint(action.option_strings):
                     action.help = argparse.SUPPRESS
                 else:
-                    action.help = action.help + " (currently selected)"
-            elif action.container.title == "Training Paradigm Arguments":
-                if set(action.option_strings).isdisjoint(set(args)):
-                    action.help = argparse.SUPPRESS
-                else:
-                    action.help = action.help + " (currently selected)"
+                    action.help += " (currently selected)"
 
         action.option_strings = [s for s in action.option_strings if "-" not in s[2:]]
         super().add_argument(action)
@@ -754,14 +773,45 @@ def launch_command_parser(subparsers=None):
     # Other arguments of the training scripts
     parser.add_argument("training_script_args", nargs=argparse.REMAINDER, help="Arguments of the training script.")
 
+    # Not a command line flag, filled in by `_validate_launch_command` from the config file or `--cpu`
+    parser.set_defaults(use_cpu=None)
+
     if subparsers is not None:
         parser.set_defaults(func=launch_command)
     return parser
 
 
+@lru_cache(maxsize=1)
+def _get_distrib_run():
+    "Imports `torch.distributed.run` and builds its argument parser only once"
+    import torch.distributed.run as distrib_run
+
+    return distrib_run, distrib_run.get_args_parser()
+
+
+@lru_cache(maxsize=1)
+def _xla_dist_parser():
+    from torch_xla.distributed import xla_dist
+
+    return xla_dist.get_args_parser()
+
+
+def _exec_launch_cmd(cmd, current_env):
+    """
+    Replaces the current process with `cmd`, avoiding an extra fork and keeping the launcher's memory out of the
+    training run. The exit code of `cmd` becomes the exit code of `accelerate launch`.
+    """
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os.execvpe(cmd[0], cmd, current_env)
+
+
 def simple_launcher(args):
     cmd, current_env = prepare_simple_launcher_cmd_env(args)
 
+    if args.quiet and os.name != "nt":
+        # Nothing is done with the exit code besides exiting, so replace this process with the training one
+        _exec_launch_cmd(cmd, current_env)
     process = subprocess.Popen(cmd, env=current_env)
     process.wait()
     if process.returncode != 0:
@@ -772,8 +822,7 @@ def simple_launcher(args):
 
 
 def multi_gpu_launcher(args):
-    import torch.distributed.run as distrib_run
-
+    distrib_run, distrib_run_parser = _get_distrib_run()
     current_env = prepare_multi_gpu_env(args)
     if not check_cuda_p2p_ib_support():
         message = "Using RTX 4000 series which doesn't support faster communication speedups. Ensuring P2P and IB communications are disabled."
@@ -790,7 +839,7 @@ def multi_gpu_launcher(args):
     debug = getattr(args, "debug", False)
     args = _filter_args(
         args,
-        distrib_run.get_args_parser(),
+        distrib_run_parser,
         ["--training_script", args.training_script, "--training_script_args", args.training_script_args],
     )
 
@@ -798,7 +847,7 @@ def multi_gpu_launcher(args):
         try:
             distrib_run.run(args)
         except Exception:
-            if is_rich_available() and debug:
+            if _rich_available and debug:
                 console = get_console()
                 console.print("\n[bold red]Using --debug, `torch.distributed` Stack Trace:[/bold red]")
                 console.print_exception(suppress=[__file__], show_locals=False)
@@ -807,8 +856,6 @@ def multi_gpu_launcher(args):
 
 
 def deepspeed_launcher(args):
-    import torch.distributed.run as distrib_run
-
     if not is_deepspeed_available():
         raise ImportError("DeepSpeed is not installed => run `pip3 install deepspeed` or build it from source.")
     else:
@@ -833,6 +880,8 @@ def deepspeed_launcher(args):
             if len(valid_env_items) > 1:
                 f.writelines(valid_env_items)
 
+        if args.quiet and os.name != "nt":
+            _exec_launch_cmd(cmd, current_env)
         process = subprocess.Popen(cmd, env=current_env)
         process.wait()
         if process.returncode != 0:
@@ -841,17 +890,18 @@ def deepspeed_launcher(args):
             else:
                 sys.exit(1)
     else:
+        distrib_run, distrib_run_parser = _get_distrib_run()
         debug = getattr(args, "debug", False)
         args = _filter_args(
             args,
-            distrib_run.get_args_parser(),
+            distrib_run_parser,
             ["--training_script", args.training_script, "--training_script_args", args.training_script_args],
         )
         with patch_environment(**current_env):
             try:
                 distrib_run.run(args)
             except Exception:
-                if is_rich_available() and debug:
+                if _rich_available and debug:
                     console = get_console()
                     console.print("\n[bold red]Using --debug, `torch.distributed` Stack Trace:[/bold red]")
                     console.print_exception(suppress=[__file__], show_locals=False)
@@ -871,9 +921,10 @@ def tpu_launcher(args):
         mod_name = args.training_script
     else:
         # Import training_script as a module
-        script_path = Path(args.training_script)
-        sys.path.append(str(script_path.parent.resolve()))
-        mod_name = script_path.stem
+        script_dir = os.path.realpath(os.path.dirname(args.training_script))
+        if script_dir not in sys.path:
+            sys.path.append(script_dir)
+        mod_name = os.path.splitext(os.path.basename(args.training_script))[0]
 
     mod = importlib.import_module(mod_name)
     if not hasattr(mod, args.main_training_function):
@@ -900,7 +951,7 @@ def tpu_pod_launcher(args):
     training_script = args.training_script
     training_script_args = args.training_script_args
     new_args = _filter_args(
-        args, xla_dist.get_args_parser(), ["--tpu", args.tpu_name, "--positional", "", "--restart-tpuvm-pod-server"]
+        args, _xla_dist_parser(), ["--tpu", args.tpu_name, "--positional", "", "--restart-tpuvm-pod-server"]
     )
 
     if args.tpu_use_sudo:
@@ -927,11 +978,10 @@ def tpu_pod_launcher(args):
 
     new_args.positional = new_cmd
     bad_flags = ""
-    for arg in vars(new_args):
-        if arg.startswith("docker_"):
-            value = getattr(new_args, arg)
-            if value != "" and value is not None:
-                bad_flags += f'{arg}="{value}"\n'
+    for arg in xla_dist_docker_flags:
+        value = getattr(new_args, arg, None)
+        if value != "" and value is not None:
+            bad_flags += f'{arg}="{value}"\n'
     if bad_flags != "":
         raise ValueError(
             f"Docker containers are not supported for TPU pod launcher currently, please remove the following flags:\n{bad_flags}"
@@ -941,7 +991,7 @@ def tpu_pod_launcher(args):
     try:
         xla_dist.resolve_and_execute(new_args)
     except Exception:
-        if is_rich_available() and debug:
+        if _rich_available and debug:
             console = get_console()
             console.print("\n[bold red]Using --debug, `torch_xla.xla_dist` Stack Trace:[/bold red]")
             console.print_exception(suppress=[__file__], show_locals=False)
@@ -969,9 +1019,58 @@ def sagemaker_launcher(sagemaker_config: SageMakerConfig, args):
     print(f"You can find your model data at: {huggingface_estimator.model_data}")
 
 
+@lru_cache(maxsize=8)
+def _load_config_from_file_cached(config_file, file_stat):
+    return load_config_from_file(config_file)
+
+
+def _load_launch_config(config_file):
+    """
+    Loads the config file used by `accelerate launch`, reusing the parsed result as long as the file is left untouched.
+    A copy is returned so that changes made to it don't leak into later launches.
+    """
+    if config_file is None:
+        config_file = default_config_file
+    try:
+        stat = os.stat(config_file)
+    except OSError:
+        # Let `load_config_from_file` raise its usual error
+        return load_config_from_file(config_file)
+    # The inode and size are part of the key since a file swapped in by `os.rename`, `cp -p` or `rsync -t` keeps its mtime
+    file_stat = (os.path.abspath(config_file), stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    return copy.deepcopy(_load_config_from_file_cached(config_file, file_stat))
+
+
+@lru_cache(maxsize=1)
+def _get_physical_cpu_count():
+    "Returns the number of physical cores, which can't change during the lifetime of the process"
+    import psutil
+
+    return psutil.cpu_count(logical=False)
+
+
+def _iter_device_counts(use_xpu=False):
+    """
+    Yields the `(backend, device_count)` of each available backend, in the order in which `accelerate launch` picks the
+    backend to train on. A backend is only queried once the generator reaches it, since getting a device count
+    initializes its runtime.
+    """
+    import torch
+
+    if use_xpu and is_xpu_available():
+        yield "xpu", torch.xpu.device_count()
+    if is_mlu_available():
+        yield "mlu", torch.mlu.device_count()
+    if is_musa_available():
+        yield "musa", torch.musa.device_count()
+    if is_npu_available():
+        yield "npu", torch.npu.device_count()
+    yield "cuda", torch.cuda.device_count()
+
+
 def _validate_launch_command(args):
     # Sanity checks
-    if sum([args.multi_gpu, args.cpu, args.tpu, args.use_deepspeed, args.use_fsdp]) > 1:
+    if args.multi_gpu + args.cpu + args.tpu + args.use_deepspeed + args.use_fsdp > 1:
         raise ValueError(
             "You can only use one of `--cpu`, `--multi_gpu`, `--tpu`, `--use_deepspeed`, `--use_fsdp` at a time."
         )
@@ -982,32 +1081,23 @@ def _validate_launch_command(args):
     warned = []
     mp_from_config_flag = False
     # Get the default from the config file.
-    if args.config_file is not None or os.path.isfile(default_config_file) and not args.cpu:
-        defaults = load_config_from_file(args.config_file)
-        if (
-            not args.multi_gpu
-            and not args.tpu
-            and not args.tpu_use_cluster
-            and not args.use_deepspeed
-            and not args.use_fsdp
-            and not args.use_megatron_lm
-        ):
-            args.use_deepspeed = defaults.distributed_type == DistributedType.DEEPSPEED
-            args.multi_gpu = (
-                True
-                if defaults.distributed_type
-                in (
-                    DistributedType.MULTI_GPU,
-                    DistributedType.MULTI_NPU,
-                    DistributedType.MULTI_MLU,
-                    DistributedType.MULTI_MUSA,
-                    DistributedType.MULTI_XPU,
-                )
-                else False
+    if args.config_file is not None or (not args.cpu and os.path.isfile(default_config_file)):
+        defaults = _load_launch_config(args.config_file)
+        if not any(
+            (
+                args.multi_gpu,
+                args.tpu,
+                args.tpu_use_cluster,
+                args.use_deepspeed,
+                args.use_fsdp,
+                args.use_megatron_lm,
             )
-            args.tpu = defaults.distributed_type == DistributedType.XLA
-            args.use_fsdp = defaults.distributed_type == DistributedType.FSDP
-            args.use_megatron_lm = defaults.distributed_type == DistributedType.MEGATRON_LM
+        ):
+            for flag in ("use_deepspeed", "multi_gpu", "tpu", "use_fsdp", "use_megatron_lm"):
+                setattr(args, flag, False)
+            flag = distributed_type_to_flag.get(defaults.distributed_type)
+            if flag is not None:
+                setattr(args, flag, True)
             args.tpu_use_cluster = defaults.tpu_use_cluster if args.tpu else False
         if args.gpu_ids is None:
             if defaults.gpu_ids is not None:
@@ -1024,32 +1114,24 @@ def _validate_launch_command(args):
                 "Please ensure at least two are specified for `--gpu_ids`, or use `--gpu_ids='all'`."
             )
         if defaults.compute_environment == ComputeEnvironment.LOCAL_MACHINE:
-            # Update args with the defaults
+            # Update args with the defaults, directly through the namespace dict
+            args_dict = vars(args)
             for name, attr in defaults.__dict__.items():
+                # The nested configs are applied once below
                 if isinstance(attr, dict):
-                    for k in defaults.deepspeed_config:
-                        setattr(args, k, defaults.deepspeed_config[k])
-                    for k in defaults.fsdp_config:
-                        arg_to_set = k
-                        if "fsdp" not in arg_to_set:
-                            arg_to_set = "fsdp_" + arg_to_set
-                        setattr(args, arg_to_set, defaults.fsdp_config[k])
-                    for k in defaults.megatron_lm_config:
-                        setattr(args, k, defaults.megatron_lm_config[k])
-                    for k in defaults.dynamo_config:
-                        setattr(args, k, defaults.dynamo_config[k])
-                    for k in defaults.ipex_config:
-                        setattr(args, k, defaults.ipex_config[k])
-                    for k in defaults.mpirun_config:
-                        setattr(args, k, defaults.mpirun_config[k])
                     continue
 
-                # Those args are handled separately
-                if (
-                    name not in ["compute_environment", "mixed_precision", "distributed_type"]
-                    and getattr(args, name, None) is None
-                ):
-                    setattr(args, name, attr)
+                if name not in separately_handled_config_fields and args_dict.get(name) is None:
+                    args_dict[name] = attr
+            args_dict.update(defaults.deepspeed_config)
+            args_dict.update({k if "fsdp" in k else "fsdp_" + k: v for k, v in defaults.fsdp_config.items()})
+            for config in (
+                defaults.megatron_lm_config,
+                defaults.dynamo_config,
+                defaults.ipex_config,
+                defaults.mpirun_config,
+            ):
+                args_dict.update(config)
         if not args.debug:
             args.debug = defaults.debug
 
@@ -1059,16 +1141,15 @@ def _validate_launch_command(args):
             else:
                 args.mixed_precision = defaults.mixed_precision
                 mp_from_config_flag = True
-        else:
+        elif args.mixed_precision == "bf16":
+            import torch
+
             if args.use_cpu or (args.use_xpu and torch.xpu.is_available()):
-                native_amp = is_torch_version(">=", "1.10")
+                # Always supported by the minimum PyTorch version accelerate requires (1.10)
+                native_amp = True
             else:
                 native_amp = is_bf16_available(True)
-            if (
-                args.mixed_precision == "bf16"
-                and not native_amp
-                and not (args.tpu and is_torch_xla_available(check_is_tpu=True))
-            ):
+            if not native_amp and not (args.tpu and is_torch_xla_available(check_is_tpu=True)):
                 raise ValueError("bf16 mixed precision requires PyTorch >= 1.10 and a supported device.")
 
         # Silently set the default here
@@ -1077,30 +1158,19 @@ def _validate_launch_command(args):
         if args.num_processes == -1:
             raise ValueError("You need to manually pass in `--num_processes` using this config yaml.")
     else:
-        if args.num_processes is None:
-            if args.use_xpu and is_xpu_available():
-                args.num_processes = torch.xpu.device_count()
-            elif is_mlu_available():
-                args.num_processes = torch.mlu.device_count()
-            elif is_musa_available():
-                args.num_processes = torch.musa.device_count()
-            elif is_npu_available():
-                args.num_processes = torch.npu.device_count()
-            else:
-                args.num_processes = torch.cuda.device_count()
+        device_counts = _iter_device_counts(args.use_xpu)
+        num_processes_from_devices = args.num_processes is None
+        if num_processes_from_devices:
+            # The first available backend is the one used for training
+            _, args.num_processes = next(device_counts)
             warned.append(f"\t`--num_processes` was set to a value of `{args.num_processes}`")
         if args.debug is None:
             args.debug = False
         if (
             not args.multi_gpu
             and args.num_processes > 1
-            and (
-                (args.use_xpu and is_xpu_available() and torch.xpu.device_count() > 1)
-                or (is_mlu_available() and torch.mlu.device_count() > 1)
-                or (is_musa_available() and torch.musa.device_count() > 1)
-                or (is_npu_available() and torch.npu.device_count() > 1)
-                or (torch.cuda.device_count() > 1)
-            )
+            # More than one device of the backend used for training was already found
+            and (num_processes_from_devices or any(device_count > 1 for _, device_count in device_counts))
         ):
             warned.append(
                 "\t\tMore than one GPU was found, enabling multi-GPU training.\n"
@@ -1113,7 +1183,7 @@ def _validate_launch_command(args):
         if args.mixed_precision is None:
             warned.append("\t`--mixed_precision` was set to a value of `'no'`")
             args.mixed_precision = "no"
-        if not hasattr(args, "use_cpu"):
+        if args.use_cpu is None:
             args.use_cpu = args.cpu
         if args.dynamo_backend is None:
             warned.append("\t`--dynamo_backend` was set to a value of `'no'`")
@@ -1121,28 +1191,28 @@ def _validate_launch_command(args):
     if args.debug:
         logger.debug("Running script in debug mode, expect distributed operations to be slightly slower.")
 
-    is_aws_env_disabled = defaults is None or (
-        defaults is not None and defaults.compute_environment != ComputeEnvironment.AMAZON_SAGEMAKER
-    )
+    is_aws_env_disabled = defaults is None or defaults.compute_environment != ComputeEnvironment.AMAZON_SAGEMAKER
     if is_aws_env_disabled and args.num_cpu_threads_per_process is None:
-        args.num_cpu_threads_per_process = get_int_from_env(["OMP_NUM_THREADS"], 1)
-        if args.use_cpu and args.num_processes >= 1 and get_int_from_env(["OMP_NUM_THREADS"], 0) == 0:
+        omp_num_threads = get_int_from_env(["OMP_NUM_THREADS"], None)
+        args.num_cpu_threads_per_process = 1 if omp_num_threads is None else omp_num_threads
+        if args.use_cpu and args.num_processes >= 1 and not omp_num_threads:
             local_size = get_int_from_env(
                 ["MPI_LOCALNRANKS", "OMPI_COMM_WORLD_LOCAL_SIZE", "MV2_COMM_WORLD_LOCAL_SIZE"],
-                max(int(args.num_processes / args.num_machines), 1),
+                max(args.num_processes // args.num_machines, 1),
             )
-            threads_per_process = int(psutil.cpu_count(logical=False) / local_size)
+            threads_per_process = _get_physical_cpu_count() // local_size
             if threads_per_process > 1:
                 args.num_cpu_threads_per_process = threads_per_process
                 warned.append(
                     f"\t`--num_cpu_threads_per_process` was set to `{args.num_cpu_threads_per_process}` to improve out-of-box performance when training on CPUs"
                 )
 
-    if any(warned):
-        message = "The following values were not passed to `accelerate launch` and had defaults used instead:\n"
-        message += "\n".join(warned)
-        message += (
-            "\nTo avoid this warning pass in values for each of the problematic parameters or run `accelerate config`."
+    if warned:
+        defaults_used = "\n".join(warned)
+        message = (
+            "The following values were not passed to `accelerate launch` and had defaults used instead:\n"
+            f"{defaults_used}\n"
+            "To avoid this warning pass in values for each of the problematic parameters or run `accelerate config`."
         )
         logger.warning(message)
     return args, defaults, mp_from_config_flag
@@ -1150,20 +1220,17 @@ def _validate_launch_command(args):
 
 def launch_command(args):
     args, defaults, mp_from_config_flag = _validate_launch_command(args)
-    # Use the proper launcher
-    if args.use_deepspeed and not args.cpu:
+    # Use the proper launcher, `--cpu` always goes through the simple (or SageMaker) one
+    use_accelerator = not args.cpu
+    if use_accelerator and args.use_deepspeed:
         args.deepspeed_fields_from_accelerate_config = list(defaults.deepspeed_config.keys()) if defaults else []
         if mp_from_config_flag:
             args.deepspeed_fields_from_accelerate_config.append("mixed_precision")
         args.deepspeed_fields_from_accelerate_config = ",".join(args.deepspeed_fields_from_accelerate_config)
         deepspeed_launcher(args)
-    elif args.use_fsdp and not args.cpu:
-        multi_gpu_launcher(args)
-    elif args.use_megatron_lm and not args.cpu:
-        multi_gpu_launcher(args)
-    elif args.multi_gpu and not args.cpu:
+    elif use_accelerator and (args.use_fsdp or args.use_megatron_lm or args.multi_gpu):
         multi_gpu_launcher(args)
-    elif args.tpu and not args.cpu:
+    elif use_accelerator and args.tpu:
         if args.tpu_use_cluster:
             tpu_pod_launcher(args)
         else:
@@ -45,10 +45,10 @@ def convert_dict_to_env_variables(current_env: dict):
     ["ACCELERATE_DEBUG_MODE=1\n", "OTHER_ENV=2\n"]
     ```
     """
-    forbidden_chars = [";", "\n", "<", ">", " "]
+    forbidden_chars = {";", "\n", "<", ">", " "}
     valid_env_items = []
     for key, value in current_env.items():
-        if all(char not in (key + value) for char in forbidden_chars) and len(key) >= 1 and len(value) >= 1:
+        if len(key) >= 1 and len(value) >= 1 and forbidden_chars.isdisjoint(key + value):
             valid_env_items.append(f"{key}={value}\n")
         else:
             logger.warning(f"WARNING: Skipping {key}={value} as it contains forbidden characters or missing values.")
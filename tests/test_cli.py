@@ -13,6 +13,7 @@
 # limitations under the License.
 
 import os
+import tempfile
 import unittest
 from pathlib import Path
 from unittest.mock import patch
@@ -134,6 +135,67 @@ class AccelerateLauncherTester(unittest.TestCase):
         self.assertEqual(python_script_cmd[1], str(self.test_file_path))
         self.assertEqual(python_script_cmd[2], test_file_arg)
 
+    def test_rewritten_config_is_reloaded(self):
+        """
+        Checks that a config file replaced in the same process is parsed again, even if it keeps its modification time,
+        and that changes made to the loaded config don't carry over to the next launch.
+        """
+        config = (
+            "compute_environment: LOCAL_MACHINE\ndistributed_type: 'NO'\nmixed_precision: '{}'\nnum_processes: {}\n"
+        )
+        parser = launch_command_parser()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            config_path = os.path.join(tmpdir, "config.yaml")
+            new_config_path = os.path.join(tmpdir, "new_config.yaml")
+            with open(config_path, "w") as f:
+                f.write(config.format("no", 1))
+            with open(new_config_path, "w") as f:
+                f.write(config.format("fp16", 2))
+            mtime_ns = os.stat(config_path).st_mtime_ns
+            os.utime(new_config_path, ns=(mtime_ns, mtime_ns))
+
+            launch_args = ["--config_file", config_path, str(self.test_file_path)]
+            args, defaults, _ = _validate_launch_command(parser.parse_args(launch_args))
+            self.assertEqual(args.num_processes, 1)
+            self.assertEqual(args.mixed_precision, "no")
+            defaults.num_processes = 4
+
+            _, defaults, _ = _validate_launch_command(parser.parse_args(launch_args))
+            self.assertEqual(defaults.num_processes, 1)
+
+            os.replace(new_config_path, config_path)
+            args, _, _ = _validate_launch_command(parser.parse_args(launch_args))
+            self.assertEqual(args.num_processes, 2)
+            self.assertEqual(args.mixed_precision, "fp16")
+
+    def test_device_count_defaults(self):
+        """
+        Checks that `--num_processes` and multi-GPU training are derived from the first available backend, and that
+        other backends are only queried when that isn't enough to decide.
+        """
+        parser = launch_command_parser()
+        for num_processes, npu_count, cuda_count, expected_num_processes, expected_multi_gpu, cuda_queried in [
+            (None, 4, 0, 4, True, False),
+            (None, 1, 2, 1, False, False),
+            (2, 1, 2, 2, True, True),
+            (2, 1, 1, 2, False, True),
+        ]:
+            with self.subTest(num_processes=num_processes, npu_count=npu_count, cuda_count=cuda_count):
+                launch_args = [str(self.test_file_path)]
+                if num_processes is not None:
+                    launch_args = ["--num_processes", str(num_processes)] + launch_args
+                with patch("accelerate.commands.launch.is_mlu_available", return_value=False), patch(
+                    "accelerate.commands.launch.is_musa_available", return_value=False
+                ), patch("accelerate.commands.launch.is_npu_available", return_value=True), patch.object(
+                    torch, "npu", create=True
+                ) as npu, patch.object(torch.cuda, "device_count", return_value=cuda_count) as cuda_device_count:
+                    npu.device_count.return_value = npu_count
+                    args, _, _ = _validate_launch_command(parser.parse_args(launch_args))
+                self.assertEqual(args.num_processes, expected_num_processes)
+                self.assertEqual(args.multi_gpu, expected_multi_gpu)
+                npu.device_count.assert_called_once()
+                self.assertEqual(cuda_device_count.called, cuda_queried)
+
 
 class LaunchArgTester(unittest.TestCase):
     """
@@ -16,6 +16,7 @@ import os
 import sys
 import unittest
 
+from accelerate.commands.launch import xla_dist_docker_flags
 from accelerate.test_utils import execute_subprocess_async, path_in_accelerate_package, require_tpu
 
 
@@ -32,3 +33,11 @@ class MultiTPUTester(unittest.TestCase):
         """.split()
         cmd = [sys.executable] + distributed_args
         execute_subprocess_async(cmd)
+
+    @require_tpu
+    def test_xla_dist_docker_flags(self):
+        from torch_xla.distributed import xla_dist
+
+        args, _ = xla_dist.get_args_parser().parse_known_args(["--tpu", "test", "--positional", ""])
+        docker_flags = {arg for arg in vars(args) if arg.startswith("docker_")}
+        assert docker_flags == set(xla_dist_docker_flags)